@@ -4,12 +4,20 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Dict
+from typing import AsyncIterator, Dict
 
-from fastapi import Depends, FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlmodel import Field, Relationship, SQLModel, Session, create_engine, select
+from sqlalchemy import Index, bindparam, delete, event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import Field, Relationship, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 app = FastAPI(
     title="Mergington High School API",
@@ -20,69 +28,49 @@ app = FastAPI(
 current_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=current_dir / "static"), name="static")
 
+SEED_DATA_PATH = current_dir / "activities_seed.json"
+
+# The app relies on SQLite-specific PRAGMAs and INSERT ... ON CONFLICT, so only
+# SQLite URLs are accepted; any SQLite driver is swapped for aiosqlite.
 DB_PATH = os.getenv("DB_PATH", "sqlite:///./data.db")
-connect_args = {"check_same_thread": False} if DB_PATH.startswith("sqlite") else {}
-engine = create_engine(DB_PATH, connect_args=connect_args)
-
-INITIAL_ACTIVITIES: Dict[str, Dict[str, object]] = {
-    "Chess Club": {
-        "description": "Learn strategies and compete in chess tournaments",
-        "schedule": "Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 12,
-        "participants": ["michael@mergington.edu", "daniel@mergington.edu"],
-    },
-    "Programming Class": {
-        "description": "Learn programming fundamentals and build software projects",
-        "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-        "max_participants": 20,
-        "participants": ["emma@mergington.edu", "sophia@mergington.edu"],
-    },
-    "Gym Class": {
-        "description": "Physical education and sports activities",
-        "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-        "max_participants": 30,
-        "participants": ["john@mergington.edu", "olivia@mergington.edu"],
-    },
-    "Soccer Team": {
-        "description": "Join the school soccer team and compete in matches",
-        "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
-        "max_participants": 22,
-        "participants": ["liam@mergington.edu", "noah@mergington.edu"],
-    },
-    "Basketball Team": {
-        "description": "Practice and play basketball with the school team",
-        "schedule": "Wednesdays and Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 15,
-        "participants": ["ava@mergington.edu", "mia@mergington.edu"],
-    },
-    "Art Club": {
-        "description": "Explore your creativity through painting and drawing",
-        "schedule": "Thursdays, 3:30 PM - 5:00 PM",
-        "max_participants": 15,
-        "participants": ["amelia@mergington.edu", "harper@mergington.edu"],
-    },
-    "Drama Club": {
-        "description": "Act, direct, and produce plays and performances",
-        "schedule": "Mondays and Wednesdays, 4:00 PM - 5:30 PM",
-        "max_participants": 20,
-        "participants": ["ella@mergington.edu", "scarlett@mergington.edu"],
-    },
-    "Math Club": {
-        "description": "Solve challenging problems and participate in math competitions",
-        "schedule": "Tuesdays, 3:30 PM - 4:30 PM",
-        "max_participants": 10,
-        "participants": ["james@mergington.edu", "benjamin@mergington.edu"],
-    },
-    "Debate Team": {
-        "description": "Develop public speaking and argumentation skills",
-        "schedule": "Fridays, 4:00 PM - 5:30 PM",
-        "max_participants": 12,
-        "participants": ["charlotte@mergington.edu", "henry@mergington.edu"],
-    },
-}
+db_url = make_url(DB_PATH)
+if db_url.get_backend_name() != "sqlite":
+    raise ValueError(f"DB_PATH must be a SQLite URL, got {DB_PATH!r}")
+engine = create_async_engine(
+    db_url.set(drivername="sqlite+aiosqlite"),
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+SQLITE_PRAGMAS = (
+    # page_size only applies to a new database, so it must run before WAL is enabled.
+    "PRAGMA page_size=8192",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Use WAL so readers don't block the writer, and relax per-commit fsyncs."""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 
 class ActivityParticipant(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_actpart_participant_activity", "participant_id", "activity_id"),
+    )
+
     activity_id: int = Field(foreign_key="activity.id", primary_key=True)
     participant_id: int = Field(foreign_key="participant.id", primary_key=True)
 
@@ -106,52 +94,103 @@ class Participant(SQLModel, table=True):
     )
 
 
-def create_db_and_tables() -> None:
-    SQLModel.metadata.create_all(engine)
+# Statements are built once at import so requests only bind parameters.
+ACTIVITIES_WITH_PARTICIPANTS = (
+    select(Activity)
+    .options(selectinload(Activity.participants))
+    .order_by(Activity.name)
+    .execution_options(yield_per=50)
+)
+ACTIVITY_ID_BY_NAME = select(Activity.id).where(Activity.name == bindparam("name"))
+PARTICIPANT_ID_BY_EMAIL = select(Participant.id).where(
+    Participant.email == bindparam("email")
+)
+INSERT_PARTICIPANT = (
+    insert(Participant)
+    .values(email=bindparam("email"))
+    .on_conflict_do_nothing(index_elements=["email"])
+    .returning(Participant.id)
+)
+INSERT_MEMBERSHIP = (
+    insert(ActivityParticipant)
+    .values(
+        activity_id=bindparam("activity_id"),
+        participant_id=bindparam("participant_id"),
+    )
+    .on_conflict_do_nothing()
+    .returning(ActivityParticipant.activity_id)
+)
+DELETE_MEMBERSHIP = delete(ActivityParticipant).where(
+    ActivityParticipant.activity_id == bindparam("activity_id"),
+    ActivityParticipant.participant_id == PARTICIPANT_ID_BY_EMAIL.scalar_subquery(),
+)
+
+
+def create_tables(connection) -> None:
+    SQLModel.metadata.create_all(connection)
+    # create_all skips indexes on tables that already exist, so add new ones explicitly.
+    for index in ActivityParticipant.__table__.indexes:
+        index.create(connection, checkfirst=True)
 
 
-def seed_initial_data() -> None:
+async def create_db_and_tables() -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(create_tables)
+
+
+async def seed_initial_data() -> None:
     """Load starter activities only if the database is empty."""
-    with Session(engine) as session:
-        existing_activity = session.exec(select(Activity.id)).first()
+    async with SessionLocal() as session:
+        existing_activity = (await session.exec(select(Activity.id))).first()
         if existing_activity:
             return
 
-        for name, data in INITIAL_ACTIVITIES.items():
+        initial_activities = orjson.loads(SEED_DATA_PATH.read_bytes())
+        participants: Dict[str, Participant] = {}
+        activities: list[Activity] = []
+        for name, data in initial_activities.items():
             activity = Activity(
                 name=name,
                 description=data["description"],
                 schedule=data["schedule"],
                 max_participants=data["max_participants"],
             )
-            session.add(activity)
-            session.commit()
-            session.refresh(activity)
-
             for email in data["participants"]:
-                participant = session.exec(
-                    select(Participant).where(Participant.email == email)
-                ).first()
+                participant = participants.get(email)
                 if participant is None:
-                    participant = Participant(email=email)
-                    session.add(participant)
-                    session.commit()
-                    session.refresh(participant)
-
+                    participant = participants[email] = Participant(email=email)
                 activity.participants.append(participant)
+            activities.append(activity)
 
-            session.add(activity)
-            session.commit()
+        session.add_all(activities)
+        await session.commit()
 
 
 @app.on_event("startup")
-def on_startup() -> None:
-    create_db_and_tables()
-    seed_initial_data()
+async def on_startup() -> None:
+    await create_db_and_tables()
+    await seed_initial_data()
 
 
-def get_session():
-    with Session(engine) as session:
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await engine.dispose()
+
+
+# Serialized /activities body, rebuilt lazily after signup/unregister clear it.
+# The version lets a stream that overlapped a mutation skip storing stale bytes.
+_activities_cache: bytes | None = None
+_activities_cache_version = 0
+
+
+def invalidate_activities_cache() -> None:
+    global _activities_cache, _activities_cache_version
+    _activities_cache = None
+    _activities_cache_version += 1
+
+
+async def get_session():
+    async with SessionLocal() as session:
         yield session
 
 
@@ -164,60 +203,118 @@ def activity_to_dict(activity: Activity) -> Dict[str, object]:
     }
 
 
+def json_response(payload: Dict[str, object]) -> Response:
+    """Serialize ``payload`` with orjson, skipping FastAPI's jsonable_encoder."""
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
+
 @app.get("/")
-def root():
+async def root():
     return RedirectResponse(url="/static/index.html")
 
 
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that always closes its body, even if sending fails early."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+async def stream_activities(version: int) -> AsyncIterator[bytes]:
+    """Yield the /activities JSON object one activity at a time.
+
+    The first yield is an empty chunk sent once the query has run, so the endpoint
+    can prime the generator and still turn query errors into a 500. Every chunk is
+    also kept to fill the cache, so peak memory on a cache miss is still
+    O(total body); streaming only improves time to first byte.
+    """
+    global _activities_cache
+    chunks = [b"{"]
+    async with SessionLocal() as session:
+        activities = await session.stream_scalars(ACTIVITIES_WITH_PARTICIPANTS)
+        yield b""
+        yield chunks[0]
+        async for activity in activities:
+            chunk = orjson.dumps({activity.name: activity_to_dict(activity)})[1:-1]
+            if len(chunks) > 1:
+                chunk = b"," + chunk
+            chunks.append(chunk)
+            yield chunk
+
+    chunks.append(b"}")
+    yield chunks[-1]
+    if version == _activities_cache_version:
+        _activities_cache = b"".join(chunks)
+
+
 @app.get("/activities")
-def get_activities(session: Session = Depends(get_session)):
-    activities = session.exec(select(Activity).order_by(Activity.name)).all()
-    return {activity.name: activity_to_dict(activity) for activity in activities}
+async def get_activities():
+    if _activities_cache is not None:
+        return Response(content=_activities_cache, media_type="application/json")
+
+    body = stream_activities(_activities_cache_version)
+    # Run the query before any bytes go out, so its errors still produce a 500.
+    await body.__anext__()
+    return ClosingStreamingResponse(body, media_type="application/json")
 
 
 @app.post("/activities/{activity_name}/signup")
-def signup_for_activity(
-    activity_name: str, email: str, session: Session = Depends(get_session)
+async def signup_for_activity(
+    activity_name: str, email: str, session: AsyncSession = Depends(get_session)
 ):
-    activity = session.exec(select(Activity).where(Activity.name == activity_name)).first()
-    if activity is None:
+    activity_id = (
+        await session.exec(ACTIVITY_ID_BY_NAME, params={"name": activity_name})
+    ).first()
+    if activity_id is None:
         raise HTTPException(status_code=404, detail="Activity not found")
 
-    if any(participant.email == email for participant in activity.participants):
+    # RETURNING yields no row when the email already exists.
+    participant_id = (
+        await session.exec(INSERT_PARTICIPANT, params={"email": email})
+    ).scalar_one_or_none()
+    if participant_id is None:
+        participant_id = (
+            await session.exec(PARTICIPANT_ID_BY_EMAIL, params={"email": email})
+        ).one()
+
+    inserted = (
+        await session.exec(
+            INSERT_MEMBERSHIP,
+            params={"activity_id": activity_id, "participant_id": participant_id},
+        )
+    ).first()
+    if inserted is None:
+        await session.rollback()
         raise HTTPException(status_code=400, detail="Student is already signed up")
 
-    participant = session.exec(select(Participant).where(Participant.email == email)).first()
-    if participant is None:
-        participant = Participant(email=email)
-        session.add(participant)
-        session.commit()
-        session.refresh(participant)
+    await session.commit()
+    invalidate_activities_cache()
 
-    activity.participants.append(participant)
-    session.add(activity)
-    session.commit()
-    session.refresh(activity)
-
-    return {"message": f"Signed up {email} for {activity_name}"}
+    return json_response({"message": f"Signed up {email} for {activity_name}"})
 
 
 @app.delete("/activities/{activity_name}/unregister")
-def unregister_from_activity(
-    activity_name: str, email: str, session: Session = Depends(get_session)
+async def unregister_from_activity(
+    activity_name: str, email: str, session: AsyncSession = Depends(get_session)
 ):
-    activity = session.exec(select(Activity).where(Activity.name == activity_name)).first()
-    if activity is None:
+    activity_id = (
+        await session.exec(ACTIVITY_ID_BY_NAME, params={"name": activity_name})
+    ).first()
+    if activity_id is None:
         raise HTTPException(status_code=404, detail="Activity not found")
 
-    participant = session.exec(select(Participant).where(Participant.email == email)).first()
-    if participant is None or participant not in activity.participants:
+    result = await session.exec(
+        DELETE_MEMBERSHIP, params={"activity_id": activity_id, "email": email}
+    )
+    if result.rowcount == 0:
         raise HTTPException(
             status_code=400, detail="Student is not signed up for this activity"
         )
 
-    activity.participants.remove(participant)
-    session.add(activity)
-    session.commit()
-    session.refresh(activity)
+    await session.commit()
+    invalidate_activities_cache()
 
-    return {"message": f"Unregistered {email} from {activity_name}"}
+    return json_response({"message": f"Unregistered {email} from {activity_name}"})